@@ -1,111 +1,175 @@
 import socket
+import struct
 import argparse
-import json
 import logging
+import logging.handlers
 import time
 import os  # Add this import at the top with other imports
 
+try:
+    import p2_reliable  # Compiled receive engine; see p2_reliable.pyx
+except ImportError:
+    p2_reliable = None
+
 # Create logs directory if it doesn't exist
 log_dir = 'logs'
 os.makedirs(log_dir, exist_ok=True)
 
 # Update log filename to use the logs directory
 log_filename = os.path.join(log_dir, f'client_{time.strftime("%Y%m%d_%H%M%S")}.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename)  # Log to timestamped file in logs directory
-    ]
-)
+file_handler = logging.FileHandler(log_filename)  # Log to timestamped file in logs directory
+file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+# Default to WARNING so per-packet records are skipped before formatting;
+# set P2_LOG_LEVEL=DEBUG to trace a transfer. Records are buffered in
+# memory and flushed to disk in batches rather than one write per record.
+logger = logging.getLogger('p2')
+logger.setLevel(getattr(logging, os.environ.get('P2_LOG_LEVEL', 'WARNING').upper(), logging.WARNING))
+logger.addHandler(logging.handlers.MemoryHandler(capacity=1024, target=file_handler))
 
 # Constants
 MSS = 1400  # Maximum Segment Size
+SOCK_BUF_SIZE = 12 * 1024 * 1024  # Kernel socket buffer size for high-BDP paths
+RING = 128  # Reorder window, in packets
 
-def receive_file(server_ip, server_port, pref_outfile):
+# Binary packet framing: fixed header followed by raw payload bytes
+PKT_HDR = struct.Struct('>IIB')  # seq, length, flags
+ACK_HDR = struct.Struct('>IIB')  # ack, window, flags
+END_BIT = 0x01  # Flag marking the end-of-transfer packet
+SO_INCOMING_CPU = getattr(socket, 'SO_INCOMING_CPU', 49)
+
+def receive_file(server_ip, server_port, pref_outfile, cpu=None):
     """
     Receive the file from the server with reliability, handling packet loss
     and reordering.
     """
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if cpu is not None:
+        # Keep the process and the socket's receive wakeups on one core so
+        # the hot recv/ACK paths share a warm cache
+        try:
+            os.sched_setaffinity(0, {cpu})
+            client_socket.setsockopt(socket.SOL_SOCKET, SO_INCOMING_CPU, cpu)
+        except OSError:
+            logger.warning("Could not pin to CPU %d, running unpinned", cpu)
+    # Default kernel buffers (~208 KiB) are far below the bandwidth-delay
+    # product of the testbed link, causing tail drops that look like congestion
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
     client_socket.settimeout(2)  # Set timeout for server response
 
     server_address = (server_ip, server_port)
     expected_seq_num = 0
     output_file_path = f"{pref_outfile}received_file.txt"  # Default file name
-    buffer = {}
+
+    # Out-of-order packets are parked in a fixed ring indexed by seq % RING;
+    # slot occupancy itself marks which sequence numbers are buffered, so no
+    # separate dedup structure is needed
+    ring = [None] * RING
 
     # Send initial connection request to server
     client_socket.sendto(b"START", server_address)
-    logging.info("Sent START signal to server")
-
-    received_packets = set()  # Add this to track received packets
+    logger.info("Sent START signal to server")
 
     # Add receiver window size
     receiver_window = 65535  # Standard TCP window size
 
-    with open(output_file_path, 'wb') as file:
+    if p2_reliable is not None:
+        # Fast path: run the whole per-packet loop in the compiled engine
+        # over a connected socket. SO_RCVTIMEO replaces settimeout so the
+        # C loop sees recv timeouts directly.
+        client_socket.connect(server_address)
+        client_socket.setblocking(True)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO,
+                                 struct.pack('ll', 2, 0))
+        out_fd = os.open(output_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            p2_reliable.recv_loop(client_socket.fileno(), out_fd, receiver_window)
+        finally:
+            os.close(out_fd)
+        logger.info("Received END signal from server, file transfer complete")
+        return
+
+    # One receive buffer reused for every datagram instead of a fresh bytes
+    # object per recvfrom
+    recv_buf = bytearray(MSS + 64)  # Allow room for headers
+    recv_view = memoryview(recv_buf)
+
+    out_fd = os.open(output_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
         while True:
             try:
                 # Receive the packet
-                packet, _ = client_socket.recvfrom(MSS + 1000)  # Allow room for headers
-                
-                packet_data = json.loads(packet.decode())
-                
-                if 'end' in packet_data and packet_data['end']:
-                    logging.info("Received END signal from server, file transfer complete")
+                nbytes, _ = client_socket.recvfrom_into(recv_buf)
+
+                seq_num, length, flags = PKT_HDR.unpack_from(recv_buf)
+
+                if flags & END_BIT:
+                    logger.info("Received END signal from server, file transfer complete")
+                    os.fsync(out_fd)
                     break
-                
-                seq_num = packet_data['seq']
-                data = packet_data['data'].encode()
-
-                if seq_num not in received_packets:  # Only process new packets
-                    if seq_num == expected_seq_num:
-                        file.write(data)
-                        received_packets.add(seq_num)
-                        logging.info(f"Received packet {seq_num}, writing to file")
+
+                data = recv_view[PKT_HDR.size:PKT_HDR.size + length]
+
+                if seq_num == expected_seq_num:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Received packet %d, writing to file", seq_num)
+                    # Collect the whole in-order run -- the new packet plus
+                    # any consecutive packets parked in the ring -- and hand
+                    # it to the kernel as one writev call
+                    pending = [data]
+                    expected_seq_num += 1
+
+                    slot = expected_seq_num % RING
+                    while ring[slot] is not None:
+                        pending.append(ring[slot])
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Writing buffered packet %d", expected_seq_num)
+                        ring[slot] = None
                         expected_seq_num += 1
-                        
-                        # Write any consecutive packets from the buffer
-                        while expected_seq_num in buffer:
-                            file.write(buffer[expected_seq_num])
-                            logging.info(f"Writing buffered packet {expected_seq_num}")
-                            expected_seq_num += 1
-                            del buffer[expected_seq_num-1]
-                        
-                        # Include receiver window in ACK
-                        send_ack(client_socket, server_address, expected_seq_num, receiver_window)
-                    elif seq_num > expected_seq_num:
-                        # Out of order packet, store in buffer
-                        buffer[seq_num] = data
-                        logging.info(f"Received out of order packet {seq_num}, buffering")
-                        send_ack(client_socket, server_address, expected_seq_num, receiver_window)
-                    else:
-                        # Duplicate or old packet, send ACK again
-                        send_ack(client_socket, server_address, expected_seq_num, receiver_window)
+                        slot = expected_seq_num % RING
+
+                    os.writev(out_fd, pending)
+
+                    # Include receiver window in ACK
+                    send_ack(client_socket, server_address, expected_seq_num, receiver_window)
+                elif expected_seq_num < seq_num < expected_seq_num + RING:
+                    # Out of order packet within the reorder window: copy out
+                    # of the shared receive buffer and park it
+                    slot = seq_num % RING
+                    if ring[slot] is None:
+                        ring[slot] = bytes(data)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Received out of order packet %d, buffering", seq_num)
+                    send_ack(client_socket, server_address, expected_seq_num, receiver_window)
+                else:
+                    # Duplicate, old, or beyond-window packet, send ACK again
+                    send_ack(client_socket, server_address, expected_seq_num, receiver_window)
             except socket.timeout:
-                logging.info("Timeout waiting for data")
+                logger.info("Timeout waiting for data")
                 send_ack(client_socket, server_address, expected_seq_num, receiver_window)
+    finally:
+        os.close(out_fd)
 
 def send_ack(client_socket, server_address, seq_num, window_size):
     """
     Send a cumulative acknowledgment with receiver window size.
     """
-    ack_packet = json.dumps({
-        'ack': seq_num,
-        'window': window_size
-    }).encode()
+    ack_packet = ACK_HDR.pack(seq_num, window_size, 0)
     client_socket.sendto(ack_packet, server_address)
-    logging.info(f"Sent ACK {seq_num} with window {window_size}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sent ACK %d with window %d", seq_num, window_size)
 
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description='Reliable file receiver over UDP.')
 parser.add_argument('server_ip', help='IP address of the server')
 parser.add_argument('server_port', type=int, help='Port number of the server')
 parser.add_argument('--pref_outfile', default='', help='Prefix for the output file')
+parser.add_argument('--cpu', type=int, default=None,
+                    help='Pin the process and socket wakeups to this CPU core')
 
 args = parser.parse_args()
-logging.info(args.pref_outfile)
+logger.info(args.pref_outfile)
 
 # Run the client
-receive_file(args.server_ip, args.server_port, args.pref_outfile)
+receive_file(args.server_ip, args.server_port, args.pref_outfile, args.cpu)
@@ -7,6 +7,7 @@ from mininet.log import setLogLevel
 import time
 import hashlib
 import os
+import numpy as np
 
 class DumbbellTopo(Topo):    
     def build(self, delay_sw2_s2='50ms'):
@@ -33,12 +34,11 @@ class DumbbellTopo(Topo):
         self.addLink(s2, sw2, delay=delay_sw2_s2, use_htb=True, r2q=1000)
 
 def jain_fairness_index(allocations):
-    n = len(allocations)
-    sum_of_allocations = sum(allocations)
-    sum_of_squares = sum(x ** 2 for x in allocations)
-    
-    jfi = (sum_of_allocations ** 2) / (n * sum_of_squares)
-    return jfi
+    # Vectorized so N-flow sweeps don't pay two Python-level passes;
+    # np.dot gives the sum of squares through BLAS
+    a = np.asarray(allocations, dtype=np.float64)
+    s = a.sum()
+    return (s * s) / (a.size * np.dot(a, a))
 
 def run():
     setLogLevel('info')
@@ -69,17 +69,24 @@ def run():
     s2 = net.get('s2')
     
     # Start servers and clients
-    s1.cmd(f"python3 p2_server.py {SERVER_IP1} {SERVER_PORT1} &")
-    s2.cmd(f"python3 p2_server.py {SERVER_IP2} {SERVER_PORT2} &")
+    # Pin each process to its own core so the scheduler cannot shuffle the
+    # hot paths across CPUs mid-measurement
+    s1.cmd(f"python3 p2_server.py {SERVER_IP1} {SERVER_PORT1} --cpu 2 &")
+    s2.cmd(f"python3 p2_server.py {SERVER_IP2} {SERVER_PORT2} --cpu 3 &")
     time.sleep(1)  # Wait for servers to start
 
     print("Starting clients...")
-    # Record start times and start clients
+    # Record start times and start clients, capturing each PID so liveness
+    # checks don't need a pgrep scan of /proc every tick
     start_time_c1 = time.time()
-    c1.cmd(f"python3 p2_client.py {SERVER_IP1} {SERVER_PORT1} --pref_outfile 1 > c1.log 2>&1 &")
-    
+    pid_c1 = int(c1.cmd(f"python3 p2_client.py {SERVER_IP1} {SERVER_PORT1} --pref_outfile 1 --cpu 0 > c1.log 2>&1 & echo $!").strip())
+
     start_time_c2 = time.time()
-    c2.cmd(f"python3 p2_client.py {SERVER_IP2} {SERVER_PORT2} --pref_outfile 2 > c2.log 2>&1 &")
+    pid_c2 = int(c2.cmd(f"python3 p2_client.py {SERVER_IP2} {SERVER_PORT2} --pref_outfile 2 --cpu 1 > c2.log 2>&1 & echo $!").strip())
+
+    def client_running(host, pid):
+        # kill -0 probes the PID without signaling it
+        return host.cmd(f"kill -0 {pid} 2>/dev/null; echo $?").strip() == '0'
 
     print("Waiting for transfers to complete...")
     # Monitor the transfer progress
@@ -89,16 +96,12 @@ def run():
     
     while time.time() - start_time_c1 < timeout:
         current_time = time.time()
-        # Check if client processes are still running
-        c1_running = c1.cmd("pgrep -f 'p2_client.py'").strip()
-        c2_running = c2.cmd("pgrep -f 'p2_client.py'").strip()
-        
         # Record completion times when processes finish
-        if not c1_running and duration_c1 is None:
+        if duration_c1 is None and not client_running(c1, pid_c1):
             duration_c1 = current_time - start_time_c1
             print(f"Client 1 finished in {duration_c1:.2f} seconds")
             
-        if not c2_running and duration_c2 is None:
+        if duration_c2 is None and not client_running(c2, pid_c2):
             duration_c2 = current_time - start_time_c2
             print(f"Client 2 finished in {duration_c2:.2f} seconds")
         
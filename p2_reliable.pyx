@@ -0,0 +1,134 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+C-level receive loop for the client.
+
+Runs the entire per-packet path -- recv, header parse, in-order/out-of-order
+handling, file write, ACK send -- without re-entering the interpreter, over a
+connected UDP socket. Build with `make build-ext`; p2_client.py falls back to
+the pure-Python loop when the compiled module is missing.
+
+The wire format matches p2_client.py / p2_server.py: a 9-byte big-endian
+header (seq u32, length u32, flags u8) followed by raw payload bytes, and
+9-byte ACKs (ack u32, window u32, flags u8).
+"""
+
+from libc.errno cimport errno, EAGAIN, EINTR
+from libc.stdint cimport uint8_t, uint32_t
+from libc.stdlib cimport calloc, malloc, free
+from libc.string cimport memcpy
+from posix.unistd cimport write
+
+cdef extern from "<sys/socket.h>" nogil:
+    ssize_t recv(int sockfd, void *buf, size_t length, int flags)
+    ssize_t send(int sockfd, const void *buf, size_t length, int flags)
+
+cdef extern from "<errno.h>" nogil:
+    int EWOULDBLOCK
+
+DEF HDR_SIZE = 9
+DEF END_BIT = 0x01
+DEF MAX_DGRAM = 1500
+DEF RING = 128  # Reorder window, in packets
+
+
+cdef inline uint32_t _be32(const unsigned char *p) noexcept nogil:
+    return ((<uint32_t>p[0]) << 24) | ((<uint32_t>p[1]) << 16) | \
+           ((<uint32_t>p[2]) << 8) | (<uint32_t>p[3])
+
+
+cdef inline void _put32(unsigned char *p, uint32_t v) noexcept nogil:
+    p[0] = <unsigned char>(v >> 24)
+    p[1] = <unsigned char>(v >> 16)
+    p[2] = <unsigned char>(v >> 8)
+    p[3] = <unsigned char>v
+
+
+cdef inline void _send_ack(int fd, uint32_t ack, uint32_t window) noexcept nogil:
+    cdef unsigned char ackbuf[HDR_SIZE]
+    _put32(ackbuf, ack)
+    _put32(ackbuf + 4, window)
+    ackbuf[8] = 0
+    send(fd, ackbuf, HDR_SIZE, 0)
+
+
+def recv_loop(int fd, int out_fd, uint32_t window_size):
+    """
+    Receive the file over the connected UDP socket `fd`, writing payload to
+    `out_fd`, until the END packet arrives. Recv timeouts (SO_RCVTIMEO must
+    be set by the caller) re-send the cumulative ACK, mirroring the Python
+    loop.
+    """
+    cdef:
+        unsigned char buf[MAX_DGRAM]
+        ssize_t n
+        uint32_t seq, length, expected = 0
+        uint8_t flags
+        uint32_t slot
+        char **slots
+        uint32_t *slot_len
+        uint8_t *present
+
+    slots = <char **>malloc(RING * sizeof(char *))
+    slot_len = <uint32_t *>calloc(RING, sizeof(uint32_t))
+    present = <uint8_t *>calloc(RING, sizeof(uint8_t))
+    if slots == NULL or slot_len == NULL or present == NULL:
+        free(slots); free(slot_len); free(present)
+        raise MemoryError()
+    for slot in range(RING):
+        slots[slot] = <char *>malloc(MAX_DGRAM)
+        if slots[slot] == NULL:
+            while slot > 0:
+                slot -= 1
+                free(slots[slot])
+            free(slots); free(slot_len); free(present)
+            raise MemoryError()
+
+    try:
+        while True:
+            with nogil:
+                n = recv(fd, buf, MAX_DGRAM, 0)
+            if n < 0:
+                if errno == EAGAIN or errno == EWOULDBLOCK or errno == EINTR:
+                    # Recv timeout: re-ACK so the server retransmits
+                    _send_ack(fd, expected, window_size)
+                    continue
+                raise OSError(errno, "recv failed")
+            if n < HDR_SIZE:
+                continue
+
+            seq = _be32(buf)
+            length = _be32(buf + 4)
+            flags = buf[8]
+
+            if flags & END_BIT:
+                break
+            if length > <uint32_t>(n - HDR_SIZE):
+                length = <uint32_t>(n - HDR_SIZE)
+
+            if seq == expected:
+                write(out_fd, buf + HDR_SIZE, length)
+                expected += 1
+                # Drain any consecutive packets parked in the reorder ring
+                while present[expected % RING]:
+                    slot = expected % RING
+                    write(out_fd, slots[slot], slot_len[slot])
+                    present[slot] = 0
+                    expected += 1
+                _send_ack(fd, expected, window_size)
+            elif seq > expected and seq < expected + RING:
+                # Out of order but within the reorder window: park it
+                slot = seq % RING
+                if not present[slot]:
+                    memcpy(slots[slot], buf + HDR_SIZE, length)
+                    slot_len[slot] = length
+                    present[slot] = 1
+                _send_ack(fd, expected, window_size)
+            else:
+                # Duplicate or old packet, re-ACK
+                _send_ack(fd, expected, window_size)
+    finally:
+        for slot in range(RING):
+            free(slots[slot])
+        free(slots)
+        free(slot_len)
+        free(present)
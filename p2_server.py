@@ -1,24 +1,31 @@
+import asyncio
+import collections
+import mmap
 import socket
+import struct
 import time
 import argparse
-import json
-import math
 import logging
+import logging.handlers
 import os  # Add this import at the top with other imports
 
+import p2_netio
+
 # Create logs directory if it doesn't exist
 log_dir = 'logs'
 os.makedirs(log_dir, exist_ok=True)
 
 # Update log filename to use the logs directory
 log_filename = os.path.join(log_dir, f'server_{time.strftime("%Y%m%d_%H%M%S")}.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename)  # Log to timestamped file in logs directory
-    ]
-)
+file_handler = logging.FileHandler(log_filename)  # Log to timestamped file in logs directory
+file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+# Default to WARNING so per-packet records are skipped before formatting;
+# set P2_LOG_LEVEL=DEBUG to trace a transfer. Records are buffered in
+# memory and flushed to disk in batches rather than one write per record.
+logger = logging.getLogger('p2')
+logger.setLevel(getattr(logging, os.environ.get('P2_LOG_LEVEL', 'WARNING').upper(), logging.WARNING))
+logger.addHandler(logging.handlers.MemoryHandler(capacity=1024, target=file_handler))
 
 # Constants
 MSS = 1400  # Maximum Segment Size for each packet
@@ -27,30 +34,46 @@ INITIAL_SSTHRESH = 64  # Initial slow start threshold (in segments)
 DUP_ACK_THRESHOLD = 3  # Threshold for duplicate ACKs to trigger fast recovery
 FILE_PATH = "file_to_send.txt"
 INITIAL_TIMEOUT = 1.0  # Initial timeout value
+SOCK_BUF_SIZE = 12 * 1024 * 1024  # Kernel socket buffer size for high-BDP paths
+CWND_SCALE = 10  # cwnd is fixed-point: an int scaled by 2**CWND_SCALE
+
+# Binary packet framing: fixed header followed by raw payload bytes
+PKT_HDR = struct.Struct('>IIB')  # seq, length, flags
+ACK_HDR = struct.Struct('>IIB')  # ack, window, flags
+END_BIT = 0x01  # Flag marking the end-of-transfer packet
+SO_INCOMING_CPU = getattr(socket, 'SO_INCOMING_CPU', 49)
 
 class CongestionControl:
+    # cwnd and ssthresh are kept as integers scaled by 2**CWND_SCALE so the
+    # per-ACK update in congestion avoidance stays in pure-int arithmetic
     def __init__(self):
-        self.cwnd = INITIAL_CWND
-        self.ssthresh = INITIAL_SSTHRESH
+        self.cwnd_q10 = INITIAL_CWND << CWND_SCALE
+        self.ssthresh_q10 = INITIAL_SSTHRESH << CWND_SCALE
         self.state = "slow_start"
         self.dup_ack_count = 0
 
+    @property
+    def cwnd_pkts(self):
+        """Congestion window in whole packets, for the send-loop check."""
+        return self.cwnd_q10 >> CWND_SCALE
+
     def on_ack_received(self, is_duplicate):
         if self.state == "slow_start":
             if not is_duplicate:
-                self.cwnd += 1
+                self.cwnd_q10 += 1 << CWND_SCALE
                 self.dup_ack_count = 0
-                if self.cwnd >= self.ssthresh:
+                if self.cwnd_q10 >= self.ssthresh_q10:
                     self.state = "congestion_avoidance"
-                    logging.info(f"Entering congestion avoidance, cwnd: {self.cwnd}")
+                    logger.info("Entering congestion avoidance, cwnd: %s", self.cwnd_pkts)
             else:
                 self.dup_ack_count += 1
                 if self.dup_ack_count == DUP_ACK_THRESHOLD:
                     self.on_triple_duplicate_ack()
         elif self.state == "congestion_avoidance":
             if not is_duplicate:
-                # Increment by 1/cwnd for each ACK (approximately 1 MSS per RTT)
-                self.cwnd += (1.0 / math.floor(self.cwnd))
+                # Increment by 1/cwnd for each ACK (approximately 1 MSS per
+                # RTT): (1 << 2*CWND_SCALE) / cwnd_q10 is 1/cwnd in Q10
+                self.cwnd_q10 += max(1, (1 << (2 * CWND_SCALE)) // self.cwnd_q10)
                 self.dup_ack_count = 0  # Reset duplicate count on new ACK
             else:
                 self.dup_ack_count += 1
@@ -59,129 +82,206 @@ class CongestionControl:
         elif self.state == "fast_recovery":
             if not is_duplicate:
                 # Exit fast recovery
-                self.cwnd = self.ssthresh
+                self.cwnd_q10 = self.ssthresh_q10
                 self.dup_ack_count = 0
                 self.state = "congestion_avoidance"
             else:
                 # Inflate the window by 1 for each additional duplicate ACK
-                self.cwnd += 1
+                self.cwnd_q10 += 1 << CWND_SCALE
 
     def on_triple_duplicate_ack(self):
-        self.ssthresh = max(math.floor(self.cwnd / 2), 2)
-        self.cwnd = self.ssthresh + 3  # Set to ssthresh + 3 for fast recovery
+        self.ssthresh_q10 = max(self.cwnd_q10 >> 1, 2 << CWND_SCALE)
+        self.cwnd_q10 = self.ssthresh_q10 + (3 << CWND_SCALE)  # ssthresh + 3 for fast recovery
         self.state = "fast_recovery"
 
     def on_timeout(self):
-        self.ssthresh = max(math.floor(self.cwnd / 2), 2)  # Changed from integer division
-        self.cwnd = INITIAL_CWND
+        self.ssthresh_q10 = max(self.cwnd_q10 >> 1, 2 << CWND_SCALE)
+        self.cwnd_q10 = INITIAL_CWND << CWND_SCALE
         self.state = "slow_start"
         self.dup_ack_count = 0
-        logging.info(f"Timeout: ssthresh={self.ssthresh}, cwnd reset to {self.cwnd}")
+        logger.info("Timeout: ssthresh=%s, cwnd reset to %s",
+                    self.ssthresh_q10 >> CWND_SCALE, self.cwnd_pkts)
 
-def send_file(server_ip, server_port):
+def send_file(server_ip, server_port, cpu=None):
     """
     Send a predefined file to the client, ensuring reliability over UDP.
     """
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if cpu is not None:
+        # Keep the process and the socket's receive wakeups on one core so
+        # the hot send/recv paths share a warm cache
+        try:
+            os.sched_setaffinity(0, {cpu})
+            server_socket.setsockopt(socket.SOL_SOCKET, SO_INCOMING_CPU, cpu)
+        except OSError:
+            logger.warning("Could not pin to CPU %d, running unpinned", cpu)
+    # Default kernel buffers (~208 KiB) are far below the bandwidth-delay
+    # product of the testbed link, causing tail drops that look like congestion
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
     server_socket.bind((server_ip, server_port))
 
-    logging.info(f"Server listening on {server_ip}:{server_port}")
+    logger.info("Server listening on %s:%s", server_ip, server_port)
 
-    client_address = None
-    file_path = FILE_PATH
+    logger.info("Waiting for client connection...")
+    data, client_address = server_socket.recvfrom(1024)
+    logger.info("Connection established with client %s", client_address)
+
+    # Batched I/O state is set up once per connection; every data packet
+    # except the file tail is exactly PKT_HDR.size + MSS bytes, which lets
+    # the GSO sender hand the kernel one buffer per burst
+    sender = p2_netio.make_sender(server_socket, client_address, PKT_HDR.size + MSS)
+    ack_receiver = p2_netio.BatchReceiver(server_socket)
+
+    asyncio.run(_transfer(server_socket, client_address, sender, ack_receiver))
+
+async def _transfer(server_socket, client_address, sender, ack_receiver):
+    """
+    Drive the reliability loop on the event loop. ACKs are drained by a
+    socket reader callback the moment they arrive, while the send pump
+    refills the window; the two are coupled only through window_event, so
+    sending no longer serializes behind one blocking ACK read at a time.
+    """
+    loop = asyncio.get_running_loop()
 
     cc = CongestionControl()
+    rtt_estimator = RTTEstimator()
 
-    with open(file_path, 'rb') as file:
-        seq_num = 0
-        window_base = 0
-        unacked_packets = {}
-        last_ack_received = -1
-        rtt_estimator = RTTEstimator()
-
-        while True:
-            # Calculate effective window size as min(cwnd, receiver_window)
-            effective_window = min(cc.cwnd, len(unacked_packets) + MSS)
-            
-            while len(unacked_packets) < effective_window:
-                chunk = file.read(MSS)
-                if not chunk:
-                    break
+    seq_num = 0
+    window_base = 0
+    # Unacked packets in sequence order: (seq, packet, send_time).
+    # Advancing the window is a popleft from the head instead of a
+    # rebuild of the whole dict per ACK.
+    unacked = collections.deque()
+    last_ack_received = -1
 
-                packet = create_packet(seq_num, chunk)
-                if client_address:
-                    server_socket.sendto(packet, client_address)
-                else:
-                    logging.info("Waiting for client connection...")
-                    data, client_address = server_socket.recvfrom(1024)
-                    logging.info(f"Connection established with client {client_address}")
-                    server_socket.sendto(packet, client_address)
-
-                unacked_packets[seq_num] = (packet, time.time())
-                logging.info(f"Sent packet {seq_num}, cwnd: {cc.cwnd:.2f}, state: {cc.state}")
-                seq_num += 1
-
-            try:
-                server_socket.settimeout(rtt_estimator.timeout)
-                ack_packet, _ = server_socket.recvfrom(1024)
-                ack_data = json.loads(ack_packet.decode())
-                ack_seq_num = ack_data['ack']
-
-                if ack_seq_num > last_ack_received:
-                    logging.info(f"Received new ACK for packet {ack_seq_num}")
-                    rtt_estimator.update(time.time() - unacked_packets[window_base][1])
-                    last_ack_received = ack_seq_num
-                    window_base = ack_seq_num
-                    
-                    # Remove acknowledged packets from the buffer
-                    unacked_packets = {k: v for k, v in unacked_packets.items() if k >= window_base}
-                    
-                    cc.on_ack_received(is_duplicate=False)
-                else:
-                    logging.info(f"Received duplicate ACK for packet {ack_seq_num}")
-                    cc.on_ack_received(is_duplicate=True)
+    # Set whenever ACK processing may have opened the window
+    window_event = asyncio.Event()
 
-                    if cc.state == "fast_recovery" and cc.dup_ack_count >= DUP_ACK_THRESHOLD:
-                        fast_recovery(server_socket, client_address, unacked_packets, window_base)
+    def on_acks_ready():
+        # Recv side: runs on the event loop whenever the socket is readable
+        # and drains every queued ACK in one recvmmsg call
+        nonlocal window_base, last_ack_received
 
-            except socket.timeout:
-                logging.info("Timeout occurred, retransmitting unacknowledged packets")
-                cc.on_timeout()
-                seq_num = min(unacked_packets.keys())
-                unacked_packets = {}
-                # retransmit_unacked_packets(server_socket, client_address, unacked_packets)
+        # One clock read per drain, shared by every RTT sample in the batch;
+        # monotonic also keeps the estimator safe from wall-clock jumps
+        now = time.monotonic()
 
-            if not chunk and len(unacked_packets) == 0:
-                logging.info("File transfer complete")
-                server_socket.sendto(json.dumps({'end': True}).encode(), client_address)
-                break
+        for ack_packet in ack_receiver.recv():
+            ack_seq_num, receiver_window, _flags = ACK_HDR.unpack_from(ack_packet)
+
+            if ack_seq_num > last_ack_received:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Received new ACK for packet %d", ack_seq_num)
+                if unacked:
+                    rtt_estimator.update(now - unacked[0][2])
+                last_ack_received = ack_seq_num
+                window_base = ack_seq_num
+
+                # Drop acknowledged packets from the head of the window
+                while unacked and unacked[0][0] < window_base:
+                    unacked.popleft()
+
+                cc.on_ack_received(is_duplicate=False)
+            else:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Received duplicate ACK for packet %d", ack_seq_num)
+                cc.on_ack_received(is_duplicate=True)
+
+                if cc.state == "fast_recovery" and cc.dup_ack_count >= DUP_ACK_THRESHOLD:
+                    fast_recovery(server_socket, client_address, unacked)
+
+        window_event.set()
+
+    server_socket.setblocking(False)
+    loop.add_reader(server_socket.fileno(), on_acks_ready)
+
+    try:
+        with open(FILE_PATH, 'rb') as file:
+            # Map the file once and slice memoryview chunks: no per-chunk
+            # read syscall and no copy until the header is prepended
+            file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            file_view = memoryview(file_map)
+            offset = 0
+            eof = False
+
+            while True:
+                # Calculate effective window size as min(cwnd, receiver_window)
+                effective_window = min(cc.cwnd_pkts, len(unacked) + MSS)
+
+                while len(unacked) < effective_window and not eof:
+                    # Accumulate up to a batch worth of packets, then hand
+                    # them to the kernel in a single call
+                    batch = []
+                    while (len(unacked) + len(batch) < effective_window
+                           and len(batch) < p2_netio.BATCH):
+                        chunk = file_view[offset:offset + MSS]
+                        if not chunk:
+                            eof = True
+                            break
+                        offset += len(chunk)
+                        batch.append((seq_num, create_packet(seq_num, chunk)))
+                        seq_num += 1
+
+                    if not batch:
+                        break
+
+                    sender.send([packet for _, packet in batch])
+                    send_time = time.monotonic()
+                    for batch_seq, packet in batch:
+                        unacked.append((batch_seq, packet, send_time))
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Sent packet %d, cwnd: %.2f, state: %s",
+                                         batch_seq, cc.cwnd_q10 / (1 << CWND_SCALE), cc.state)
+
+                if eof and not unacked:
+                    logger.info("File transfer complete")
+                    server_socket.sendto(PKT_HDR.pack(seq_num, 0, END_BIT), client_address)
+                    break
+
+                # Wait for ACK activity with the retransmission timer running
+                try:
+                    await asyncio.wait_for(window_event.wait(), rtt_estimator.timeout)
+                except asyncio.TimeoutError:
+                    logger.info("Timeout occurred, retransmitting unacknowledged packets")
+                    cc.on_timeout()
+                    retransmit_unacked_packets(sender, unacked)
+                else:
+                    window_event.clear()
+    finally:
+        loop.remove_reader(server_socket.fileno())
 
 def create_packet(seq_num, data):
     """
-    Create a packet with the sequence number and data.
+    Create a packet with a binary header (seq, length, flags) followed by
+    the raw payload bytes. Accepts bytes or a memoryview slice.
     """
-    packet = {
-        'seq': seq_num,
-        'length': len(data),
-        'data': data.decode()
-    }
-    return json.dumps(packet).encode()
-
-def retransmit_unacked_packets(server_socket, client_address, unacked_packets):
+    return PKT_HDR.pack(seq_num, len(data), 0) + bytes(data)
+
+def retransmit_unacked_packets(sender, unacked):
     """
-    Retransmit all unacknowledged packets.
+    Retransmit all unacknowledged packets in sequence order through the
+    batch sender, then restamp their send times so RTT samples taken
+    against a retransmitted packet are discarded (Karn's algorithm).
     """
-    for seq_num, (packet, _) in unacked_packets.items():
-        server_socket.sendto(packet, client_address)
-        logging.info(f"Retransmitted packet {seq_num}")
+    if not unacked:
+        return
+    sender.send([packet for _, packet, _ in unacked])
+    now = time.monotonic()
+    restamped = [(seq_num, packet, now) for seq_num, packet, _ in unacked]
+    unacked.clear()
+    unacked.extend(restamped)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Retransmitted packets %d-%d", unacked[0][0], unacked[-1][0])
 
-def fast_recovery(server_socket, client_address, unacked_packets, window_base):
+def fast_recovery(server_socket, client_address, unacked):
     """
     Retransmit the earliest unacknowledged packet (fast recovery).
     """
-    if window_base in unacked_packets:
-        server_socket.sendto(unacked_packets[window_base][0], client_address)
-        logging.info(f"Fast recovery: Retransmitted packet {window_base}")
+    if unacked:
+        server_socket.sendto(unacked[0][1], client_address)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Fast recovery: Retransmitted packet %d", unacked[0][0])
 
 class RTTEstimator:
     #  lec 24
@@ -191,20 +291,30 @@ class RTTEstimator:
         self.timeout = INITIAL_TIMEOUT
 
     def update(self, rtt):
-        if self.srtt is None:
-            self.srtt = rtt
-            self.rttvar = rtt / 2
+        # Called once per new ACK: keep attribute loads to one each and
+        # avoid the abs() global lookup in favor of a plain sign flip
+        srtt = self.srtt
+        if srtt is None:
+            srtt = rtt
+            rttvar = rtt / 2
         else:
-            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
-            self.srtt = 0.875 * self.srtt + 0.125 * rtt
-        self.timeout = self.srtt + 4 * self.rttvar
+            d = srtt - rtt
+            if d < 0.0:
+                d = -d
+            rttvar = self.rttvar * 0.75 + d * 0.25
+            srtt = srtt * 0.875 + rtt * 0.125
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self.timeout = srtt + 4.0 * rttvar
 
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description='Reliable file transfer server over UDP with TCP Reno congestion control.')
 parser.add_argument('server_ip', help='IP address of the server')
 parser.add_argument('server_port', type=int, help='Port number of the server')
+parser.add_argument('--cpu', type=int, default=None,
+                    help='Pin the process and socket wakeups to this CPU core')
 
 args = parser.parse_args()
 
 # Run the server
-send_file(args.server_ip, args.server_port)
+send_file(args.server_ip, args.server_port, args.cpu)